@@ -136,3 +136,42 @@ def covered(moving: objects.Variable, static: objects.Variable):
     return True
   else:
     raise Exception('Unsupported object type')
+
+
+def collision(variables):
+  """
+  first collision among the objects of one duration, in depth order
+  """
+  previous_moving = []
+  for var in variables:
+    if var.ignored:
+      continue
+    if var.moving:
+      for previous in previous_moving:
+        if overlap(var, previous):
+          return f'{var.name} overlaps {previous.name}'
+      previous_moving.append(var)
+    else:
+      for previous in previous_moving:
+        if covered(previous, var):
+          return f'{var.name} is covered by {previous.name}'
+  return None
+
+
+def collisions(durations, fail_fast=False):
+  """
+  check a chunk of (index, variables) durations, returning (index, message) pairs;
+  an unexpected exception is returned in place of the message and ends the chunk
+  """
+  errors = []
+  for index, variables in durations:
+    try:
+      message = collision(variables)
+    except Exception as e:
+      errors.append((index, e))
+      break
+    if message is not None:
+      errors.append((index, message))
+      if fail_fast:
+        break
+  return errors
@@ -1,13 +1,15 @@
 from lark import Lark, Tree, Token
-from dataclasses import dataclass, field
-from typing import List, Dict, Tuple, Union
+from dataclasses import dataclass, field, replace
+from typing import List, Dict, Set, Tuple, Optional, Union
 from collections import defaultdict
 from copy import deepcopy
 from argparse import ArgumentParser
+from concurrent.futures import Executor, ProcessPoolExecutor, as_completed
+import os
 
 import generate
 from objects import *
-from check import covered, overlap
+from check import collision, collisions
 from type import type, TypeException, Typing, eval_exp
 
 
@@ -33,12 +35,28 @@ class Array:
   shape: Tuple[int, ...]
   object_shape: str
 
+@dataclass
+class Snapshot:
+  node: Token
+  variables: List[Variable]
+
 @dataclass
 class EvalState:
   variables: 'defaultdict[str, List[int]]' = field(default_factory=lambda: defaultdict(list))
   arrays: Dict[str, Array] = field(default_factory=dict)
   variable_by_depth: List[Variable] = field(default_factory=list)
   depth: int = 0
+  # record collision checks as snapshots instead of running them in `eval`
+  deferred: bool = False
+  snapshots: List[Snapshot] = field(default_factory=list)
+  # objects that are ever visible; the others are left out of the output
+  live: Optional[Set[str]] = None
+  eliminated: int = 0
+  eliminated_sets: int = 0
+  # emit identical consecutive loop iterations once, repeated
+  fold: bool = False
+  # ids of timeline groups only increase, since folding shortens the timeline
+  timeline_ids: int = 0
 
   svg: generate.SVG = field(default_factory=lambda: generate.SVG(500, 500))
 
@@ -53,11 +71,12 @@ class EvalState:
   def __post_init__(self):
     self.svg.append(generate.Group(id='objects'))
     self.svg.append(generate.Group(id='timeline'))
-    animations = generate.Group(x=0, id=f'group_0')
+    index = self.next_id()
+    animations = generate.Group(x=0, id=f'group_{index}')
     point = generate.Animate(
       'x', to=0,
       dur=f'0.01s',
-      id=f'animate_0',
+      id=f'animate_{index}',
     )
     animations.append(point)
     self.add_animations(animations)
@@ -68,6 +87,116 @@ class EvalState:
   def add_animations(self, group):
     self.timeline.append(group)
 
+  def next_id(self) -> int:
+    index = self.timeline_ids
+    self.timeline_ids += 1
+    return index
+
+  def fold_animations(self, marks: List[int]):
+    """
+    replace runs of identical iterations, `timeline[marks[i]:marks[i+1]]`, by one repeated group
+    """
+    iterations = [self.timeline.children[marks[i]:marks[i+1]] for i in range(len(marks) - 1)]
+    signatures = [iteration_signature(iteration) for iteration in iterations]
+    children = self.timeline.children[:marks[0]]
+    i = 0
+    while i < len(iterations):
+      j = i + 1
+      while j < len(iterations) and signatures[i] is not None and signatures[j] == signatures[i]:
+        j += 1
+      if j - i > 1:
+        children.append(self.repeat_animations(iterations[i], j - i))
+      else:
+        children.extend(iterations[i])
+      i = j
+    # each group begins when the group before it ends
+    for previous, group in zip(children[marks[0] - 1:], children[marks[0]:]):
+      group[0]['begin'] = f'{previous[0]["id"]}.end'
+    self.timeline.children = children + self.timeline.children[marks[-1]:]
+
+  def repeat_animations(self, groups: List[generate.Group], count: int) -> generate.Group:
+    objects = {'#' + object['id']: object for object in self.objects}
+    times = [float(group[0]['dur'][:-1]) for group in groups]
+    total = sum(times)
+    starts = [sum(times[:i]) for i in range(len(times) + 1)]
+    key_times = ';'.join(f'{start / total:.12g}' for start in starts)
+    opacities = defaultdict(lambda: [0] * len(groups))
+    moves = defaultdict(lambda: [0] * len(groups))
+    for i, group in enumerate(groups):
+      for child in group.children[1:]:
+        if child['attributeName'] == 'opacity':
+          opacities[child['xlink:href']][i] = child['to']
+        else:
+          moves[child['xlink:href'], child['attributeName']][i] = child['by']
+
+    animations = generate.Group(x=0, id=groups[0]['id'])
+    point = generate.Animate(
+      'x', to=0,
+      dur=f'{total:g}s',
+      id=groups[0][0]['id'],
+      begin=groups[0][0]['begin'],
+      repeatCount=count,
+    )
+    point_dict = {'begin': f'{point["id"]}.begin'}
+    repeat_dict = {'dur': f'{total:g}s', 'repeatCount': count}
+    animations.append(point)
+    for href, values in opacities.items():
+      object_dict = {'object': objects[href]}
+      if all(value == values[0] for value in values):
+        animations.append(generate.Set('opacity', values[0], **point_dict, **object_dict))
+      else:
+        animations.append(generate.Animate(
+          attributeName='opacity',
+          values=';'.join(str(value) for value in values),
+          keyTimes=key_times.rsplit(';', 1)[0],
+          calcMode='discrete',
+          **repeat_dict,
+          **object_dict,
+          **point_dict
+        ))
+    for (href, name), values in moves.items():
+      object_dict = {'object': objects[href]}
+      if len(values) == 1:
+        animations.append(generate.Animate(
+          attributeName=name,
+          by=values[0],
+          accumulate='sum',
+          **repeat_dict,
+          **object_dict,
+          **point_dict
+        ))
+      else:
+        positions = [sum(values[:i]) for i in range(len(values) + 1)]
+        animations.append(generate.Animate(
+          attributeName=name,
+          values=';'.join(str(position) for position in positions),
+          keyTimes=key_times,
+          additive='sum',
+          accumulate='sum',
+          **repeat_dict,
+          **object_dict,
+          **point_dict
+        ))
+    return animations
+
+
+def iteration_signature(groups: List[generate.Group]):
+  """
+  the groups of one loop iteration with ids stripped, or None if they cannot be repeated
+  """
+  if not groups or any('repeatCount' in group[0].attributes for group in groups):
+    return None
+  # a zero-length duration has no interval in keyTimes to animate over
+  if any(float(group[0]['dur'][:-1]) == 0 for group in groups):
+    return None
+  return tuple(
+    (group[0]['dur'], tuple(
+      tuple((key, value) for key, value in child.attributes.items() if key not in ('id', 'begin'))
+      for child in group.children[1:]
+    ))
+    for group in groups
+  )
+
 def eval(tree: Tree, state: EvalState) -> EvalState:
   def assert_int(x, node):
     import math
@@ -87,11 +216,16 @@ def eval(tree: Tree, state: EvalState) -> EvalState:
     nv1 = eval_exp(tree.children[1], state)
     nv2 = eval_exp(tree.children[2], state)
     var = tree.children[0].value
+    marks = []
     while nv1 <= nv2:
+      marks.append(len(state.timeline))
       state.variables[var].append(nv1)
       state = eval(tree.children[3], state)
       state.variables[var].pop()
       nv1 += 1
+    marks.append(len(state.timeline))
+    if state.fold and len(marks) > 2:
+      state.fold_animations(marks)
     return state
   elif tree.data == 'object_init':
     var = tree.children[0].value
@@ -142,9 +276,6 @@ def eval(tree: Tree, state: EvalState) -> EvalState:
       object = generate.Circle(x, y, r, fill='#'+fill, id=name, opacity=0)
     else:
       raise Exception(f'unexpected object shape {state.arrays[var].object_shape}')
-    state.add_object(object)
-    for point in state.timeline:
-      point.append(generate.Set('opacity', 0, object=object, begin=f'{point.children[0]["id"]}.begin'))
     variable = Variable(
       name=name,
       x=x,
@@ -153,8 +284,15 @@ def eval(tree: Tree, state: EvalState) -> EvalState:
       depth=state.depth
     )
     state.arrays[var].values[dims] = variable
-    state.variable_by_depth.append(variable)
     state.depth += 1
+    if state.live is not None and var + str(dims) not in state.live:
+      state.eliminated += 1
+      state.eliminated_sets += len(state.timeline)
+      return state
+    state.add_object(object)
+    for point in state.timeline:
+      point.append(generate.Set('opacity', 0, object=object, begin=f'{point.children[0]["id"]}.begin'))
+    state.variable_by_depth.append(variable)
     return state
   elif tree.data == 'move':
     var, dims = get_object(tree.children[0], state)
@@ -170,17 +308,24 @@ def eval(tree: Tree, state: EvalState) -> EvalState:
   elif tree.data == 'duration':
     time = eval_exp(tree.children[0], state)
     state = eval(tree.children[1], state)
-    animations = generate.Group(x=0, id=f'group_{len(state.timeline)}')
+    index = state.next_id()
+    animations = generate.Group(x=0, id=f'group_{index}')
     point = generate.Animate(
       'x', to=0,
       dur=f'{time}s',
-      id=f'animate_{len(state.timeline)}',
+      id=f'animate_{index}',
       begin=f'{state.timeline[-1][0]["id"]}.end'
     )
     point_dict = {'begin': f'{point["id"]}.begin'}
     animations.append(point)
     state.add_animations(animations)
-    previous_moving = []
+    state.eliminated_sets += state.eliminated
+    if state.deferred:
+      state.snapshots.append(Snapshot(tree.data, [replace(var) for var in state.variable_by_depth]))
+    else:
+      message = collision(state.variable_by_depth)
+      if message is not None:
+        raise EvalException(message, tree)
     for var, object in zip(state.variable_by_depth, state.objects):
       object_dict = {'object': object}
       animations.append(generate.Set('opacity', 1 if var.appeared else 0, **point_dict, **object_dict))
@@ -209,20 +354,9 @@ def eval(tree: Tree, state: EvalState) -> EvalState:
             **object_dict,
             **point_dict
           ))
-        copy = deepcopy(var)
-        if not var.ignored:
-          for previous in previous_moving:
-            if overlap(var, previous):
-              raise EvalException(f'{var.name} overlaps {previous.name}', tree)
-          previous_moving.append(copy)
         var.x += var.moving[0]
         var.y += var.moving[1]
         var.moving = None
-      else:
-        if not var.ignored:
-          for previous in previous_moving:
-            if covered(previous, var):
-              raise EvalException(f'{var.name} is covered by {previous.name}', tree)
     return state
   else:
     assert tree.data == 'term'
@@ -242,11 +376,80 @@ def eval(tree: Tree, state: EvalState) -> EvalState:
     return state
 
 
+def validate(snapshots: List[Snapshot], executor: Executor, fail_fast=False, chunksize=None) -> List[Exception]:
+  """
+  check deferred snapshots on `executor`, returning errors ordered by duration;
+  an unexpected exception ends the list, since evaluation would have stopped there
+  """
+  if chunksize is None:
+    chunksize = max(1, len(snapshots) // (4 * (os.cpu_count() or 1)))
+  futures = {}
+  for start in range(0, len(snapshots), chunksize):
+    chunk = [(i, snapshots[i].variables) for i in range(start, min(start + chunksize, len(snapshots)))]
+    futures[executor.submit(collisions, chunk, fail_fast)] = start
+  errors = {}
+  for future in as_completed(futures):
+    if future.cancelled():
+      continue
+    for index, message in future.result():
+      if isinstance(message, Exception):
+        errors[index] = message
+      else:
+        errors[index] = EvalException(message, snapshots[index].node)
+    stops = [i for i, error in errors.items() if fail_fast or not isinstance(error, EvalException)]
+    if stops:
+      for other, start in futures.items():
+        if start > min(stops):
+          other.cancel()
+  ordered = []
+  for i in sorted(errors):
+    ordered.append(errors[i])
+    if not isinstance(errors[i], EvalException):
+      break
+  if fail_fast:
+    return ordered[:1]
+  return ordered
+
+
+def run(tree: Tree, state: EvalState, executor: Optional[Executor] = None, fail_fast=False) -> List[EvalException]:
+  """
+  evaluate `tree` into `state`, validating deferred snapshots on `executor`;
+  an unexpected exception is raised if no earlier duration failed
+  """
+  errors = []
+  try:
+    eval(tree, state)
+  except EvalException as e:
+    errors.append(e)
+  except Exception as e:
+    if not state.deferred:
+      raise
+    errors.append(e)
+  if state.deferred:
+    # every recorded duration precedes an evaluation error
+    errors = validate(state.snapshots, executor, fail_fast) + errors
+    for i, e in enumerate(errors):
+      if not isinstance(e, EvalException):
+        # evaluation would have stopped here
+        if i == 0:
+          raise e
+        errors = errors[:i]
+        break
+    if fail_fast:
+      errors = errors[:1]
+  return errors
+
+
 def get_args(args=None):
   parser = ArgumentParser()
   parser.add_argument('--input', type=str, default='demo.txt')
   parser.add_argument('--output', type=str, default='demo.svg')
   parser.add_argument('--print-type', action='store_true', default=False)
+  parser.add_argument('--parallel-check', action='store_true', default=False)
+  parser.add_argument('--jobs', type=int, default=None)
+  parser.add_argument('--fail-fast', action='store_true', default=False)
+  parser.add_argument('--eliminate-dead', action='store_true', default=False)
+  parser.add_argument('--fold-loops', action='store_true', default=False)
   return parser.parse_args(args)
 
 
@@ -270,12 +473,21 @@ def main():
         f" {'Move' if state[0] else 'Static'},")
     print("}")
 
-  state = EvalState()
-  try:
-    state = eval(tree, state)
-  except EvalException as e:
-    print(f'Error: {e}')
+  state = EvalState(deferred=args.parallel_check, fold=args.fold_loops)
+  if args.eliminate_dead:
+    state.live = typing.visible
+  if state.deferred:
+    with ProcessPoolExecutor(args.jobs) as executor:
+      errors = run(tree, state, executor, args.fail_fast)
+  else:
+    errors = run(tree, state)
+  if errors:
+    for e in errors:
+      print(f'Error: {e}')
     return
+  if args.eliminate_dead:
+    print(f'Eliminated {state.eliminated} of {state.depth} objects, '
+      f'{state.eliminated_sets} opacity sets')
   with open(args.output, 'w') as f:
     f.write(state.svg.to_string())
 
@@ -0,0 +1,4 @@
+"""
+frozen copies of the modules from before the optimized paths, with imports made
+relative; fuzz.py uses them as the oracle, so do not change them along with the tree
+"""
@@ -1,6 +1,6 @@
 from lark import Tree, Token
 from dataclasses import dataclass, field
-from typing import List, Dict, Union
+from typing import List, Dict, Set, Union
 from collections import defaultdict
 from argparse import ArgumentParser
 
@@ -24,6 +24,8 @@ class TypeException(Exception):
 class Typing:
     variables: 'defaultdict[str, List[int]]' = field(default_factory=lambda: defaultdict(list))
     arrays: Dict[str, List[int]] = field(default_factory=dict)
+    # objects that have appeared during at least one duration
+    visible: Set[str] = field(default_factory=set)
 
 
 def eval_exp(tree: Union[Tree, Token], state: Typing):
@@ -111,6 +113,8 @@ def type(tree: Tree, state: Typing) -> Typing:
     elif tree.data == 'duration':
         state = type(tree.children[1], state)
         for object in state.arrays:
+            if state.arrays[object][0] == 0:
+                state.visible.add(object)
             state.arrays[object][2] = 0
         return state
     else: